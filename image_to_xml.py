@@ -2,10 +2,21 @@
 from __future__ import annotations
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+from functools import partial
+import hashlib
+import mmap
 import os
+import re
 from pathlib import Path
 import sys
-import xml.etree.ElementTree as ET
+from typing import Iterable
+
+try:
+    from lxml import etree as ET
+except ImportError as exc:
+    raise SystemExit("Missing dependency: lxml. Install with: pip install lxml") from exc
 
 try:
     from PIL import Image
@@ -17,9 +28,23 @@ try:
 except ImportError as exc:
     raise SystemExit("Missing dependency: pytesseract. Install with: pip install pytesseract") from exc
 
+try:
+    import tesserocr  # type: ignore
+except ImportError:
+    tesserocr = None
+
 
 IMAGE_EXTS = {".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp", ".webp"}
 
+# Tesseract time grows with pixel count; larger scans are shrunk to this long edge
+MAX_OCR_EDGE = 2400
+_THRESHOLD_LUT = [0] * 128 + [255] * 128
+# Cache key suffix for preprocessed OCR; bump when preprocess_image changes output
+_PREPROCESS_KEY = "pre2"
+
+# XML 1.0 forbids these control characters and noncharacters; lxml refuses to serialize them
+_INVALID_XML_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
 
 def iter_images(folder: Path) -> list[Path]:
     files = [p for p in folder.iterdir() if p.is_file() and p.suffix.lower() in IMAGE_EXTS]
@@ -27,25 +52,107 @@ def iter_images(folder: Path) -> list[Path]:
     return files
 
 
-def ocr_image(path: Path, lang: str) -> str:
+# Per-process Tesseract handle, created once by _init_worker when tesserocr is installed
+_TESS_API = None
+
+
+def _init_worker(tesseract_cmd: str, tessdata_dir: str, lang: str) -> None:
+    # Worker processes do not inherit module state on spawn-based platforms.
+    global _TESS_API
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    if tesserocr is not None:
+        # Load the language data once and reuse it for every image in this worker
+        if tessdata_dir:
+            _TESS_API = tesserocr.PyTessBaseAPI(path=tessdata_dir, lang=lang)
+        else:
+            _TESS_API = tesserocr.PyTessBaseAPI(lang=lang)
+
+
+def _image_to_string(img: "Image.Image", lang: str) -> str:
+    if _TESS_API is not None:
+        _TESS_API.SetImage(img)
+        return _TESS_API.GetUTF8Text()
+    return pytesseract.image_to_string(img, lang=lang)
+
+
+def read_cache(cache_dir: str, key: str) -> str | None:
+    path = os.path.join(cache_dir, f"{key}.txt")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def write_cache(cache_dir: str, key: str, text: str) -> None:
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, f"{key}.txt")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    # Atomic so a concurrent or interrupted run never sees a partial entry
+    os.replace(tmp_path, path)
+
+
+def preprocess_image(img: Image.Image) -> Image.Image:
+    if img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info:
+        # Composite onto white like pytesseract does; a plain convert() would
+        # turn transparent pixels black
+        background = Image.new("RGBA", img.size, (255, 255, 255, 255))
+        img = Image.alpha_composite(background, img.convert("RGBA"))
+    img = img.convert("L")
+    if max(img.size) > MAX_OCR_EDGE:
+        img.thumbnail((MAX_OCR_EDGE, MAX_OCR_EDGE), Image.LANCZOS)
+    return img.point(_THRESHOLD_LUT, mode="1")
+
+
+def ocr_image(path: Path, lang: str, cache_dir: str = "", preprocess: bool = True) -> str:
+    key = ""
+    if cache_dir:
+        # Hash through a mapping so the file is not copied into memory
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            key = f"{hashlib.sha1(mm).hexdigest()}-{lang}" + (f"-{_PREPROCESS_KEY}" if preprocess else "")
+        cached = read_cache(cache_dir, key)
+        if cached is not None:
+            return cached
+    # Decode from the path: PIL's format probing seeks past the end of short
+    # inputs, which a real file tolerates and an mmap does not.
     with Image.open(path) as img:
-        return pytesseract.image_to_string(img, lang=lang)
-
-
-def build_xml(items: list[dict]) -> ET.Element:
-    root = ET.Element("document")
-    for item in items:
-        page_el = ET.SubElement(root, "page")
-        ET.SubElement(page_el, "image").text = item["image"]
-        text_el = ET.SubElement(page_el, "text")
-        for para in [p.strip() for p in item["text"].split("\n\n") if p.strip()]:
-            ET.SubElement(text_el, "p").text = para
-    return root
-
-
-def write_xml(root: ET.Element, output_path: Path) -> None:
-    tree = ET.ElementTree(root)
-    tree.write(output_path, encoding="utf-8", xml_declaration=True)
+        if preprocess:
+            img = preprocess_image(img)
+        text = _image_to_string(img, lang)
+    if cache_dir:
+        write_cache(cache_dir, key, text)
+    return text
+
+
+def build_page(item: dict) -> ET._Element:
+    page_el = ET.Element("page")
+    ET.SubElement(page_el, "image").text = item["image"]
+    text_el = ET.SubElement(page_el, "text")
+    text = _INVALID_XML_RE.sub("", item["text"])
+    for para in [p.strip() for p in text.split("\n\n") if p.strip()]:
+        ET.SubElement(text_el, "p").text = para
+    return page_el
+
+
+def write_xml(items: Iterable[dict], output_path: Path) -> None:
+    # Stream one <page> at a time so the whole document never sits in memory.
+    # OCR is still running while we write, so write next to the output and swap
+    # it in only once every page succeeded; a failure leaves the old file alone.
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb", buffering=1 << 20) as f, ET.xmlfile(f, encoding="utf-8") as xf:
+            xf.write_declaration()
+            with xf.element("document"):
+                for item in items:
+                    xf.write(build_page(item))
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
 
 
 def parse_args(argv: list[str]) -> argparse.Namespace:
@@ -74,6 +181,27 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
         default="",
         help="Path to tessdata directory (optional)",
     )
+    parser.add_argument(
+        "--no-preprocess",
+        action="store_true",
+        help="Skip grayscale, downscale and binarize before OCR",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=".cache",
+        help="Directory to store cached OCR results (default: .cache)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Disable cache and always run OCR",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Number of OCR worker processes (default: one per CPU)",
+    )
     return parser.parse_args(argv)
 
 
@@ -93,13 +221,23 @@ def main(argv: list[str]) -> int:
         print("No images found.", file=sys.stderr)
         return 2
 
-    items = []
-    for path in images:
-        text = ocr_image(path, args.lang)
-        items.append({"image": str(path), "text": text})
-
-    root = build_xml(items)
-    write_xml(root, Path(args.output))
+    workers = args.workers if args.workers > 0 else os.cpu_count() or 1
+    workers = min(len(images), workers)
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(args.tesseract_cmd, args.tessdata_dir, args.lang),
+    ) as executor:
+        worker = partial(
+            ocr_image,
+            lang=args.lang,
+            cache_dir="" if args.no_cache else args.cache_dir,
+            preprocess=not args.no_preprocess,
+        )
+        # map() yields results in image order as they finish
+        texts = executor.map(worker, images, chunksize=1)
+        items = ({"image": str(path), "text": text} for path, text in zip(images, texts))
+        write_xml(items, Path(args.output))
     return 0
 
 
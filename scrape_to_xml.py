@@ -2,14 +2,30 @@
 from __future__ import annotations
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+import io
 import re
 import sys
 import time
 from html.parser import HTMLParser
-from typing import List, Optional
+from typing import Iterable, List, Optional, Tuple
 from urllib.parse import urlparse, urlunparse, urljoin
-from urllib.request import Request, urlopen
-import xml.etree.ElementTree as ET
+
+try:
+    from lxml import etree as ET
+except ImportError as exc:
+    raise SystemExit("Missing dependency: lxml. Install with: pip install lxml") from exc
+
+try:
+    import requests
+except ImportError as exc:
+    raise SystemExit("Missing dependency: requests. Install with: pip install requests") from exc
+
+try:
+    from selectolax.lexbor import LexborHTMLParser  # type: ignore
+except ImportError:
+    LexborHTMLParser = None
 
 
 BLOCK_TAGS = {
@@ -39,12 +55,39 @@ BLOCK_TAGS = {
 
 SKIP_TAGS = {"script", "style", "noscript", "svg", "canvas", "iframe", "head"}
 
+VOID_TAGS = {
+    "area",
+    "base",
+    "br",
+    "col",
+    "embed",
+    "hr",
+    "img",
+    "input",
+    "link",
+    "meta",
+    "source",
+    "track",
+    "wbr",
+}
+
+NEXT_ALTS = {"next", "next part", "next page"}
+
+# Characters XML 1.0 cannot hold; scraped pages do contain them now and then
+_INVALID_XML_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+_WS_RE = re.compile(r"[ \t]+")
+_NL3_RE = re.compile(r"\n{3,}")
+_NL2_RE = re.compile(r"\n{2,}")
+_CACHE_KEY_RE = re.compile(r"[^A-Za-z0-9._-]+")
+
 
 class TextExtractor(HTMLParser):
     def __init__(self) -> None:
         super().__init__()
         self._skip_depth = 0
-        self._chunks: List[str] = []
+        self._head_depth = 0
+        self._buf = io.StringIO()
         self._title: Optional[str] = None
         self._in_title = False
 
@@ -53,91 +96,149 @@ class TextExtractor(HTMLParser):
         return self._title or ""
 
     def get_text(self) -> str:
-        text = "".join(self._chunks)
-        text = re.sub(r"[ \t]+", " ", text)
-        text = re.sub(r"\n{3,}", "\n\n", text)
+        text = self._buf.getvalue()
+        text = _WS_RE.sub(" ", text)
+        text = _NL3_RE.sub("\n\n", text)
         return text.strip()
 
     def handle_starttag(self, tag: str, attrs) -> None:
         tag = tag.lower()
         if tag in SKIP_TAGS:
             self._skip_depth += 1
+            if tag == "head":
+                self._head_depth += 1
             return
         if tag == "title":
             self._in_title = True
         if tag == "br":
-            self._chunks.append("\n")
+            self._buf.write("\n")
 
     def handle_endtag(self, tag: str) -> None:
         tag = tag.lower()
         if tag in SKIP_TAGS and self._skip_depth > 0:
             self._skip_depth -= 1
+            if tag == "head" and self._head_depth > 0:
+                self._head_depth -= 1
             return
         if tag == "title":
             self._in_title = False
         if tag in BLOCK_TAGS:
-            self._chunks.append("\n")
+            self._buf.write("\n")
 
     def handle_data(self, data: str) -> None:
-        if self._skip_depth > 0:
+        # <title> lives inside the skipped <head>, so only skipping caused by
+        # <head> itself may let it through; <svg><title> and the like stay out.
+        if self._skip_depth > self._head_depth:
             return
         if self._in_title:
             title = data.strip()
             if title:
                 self._title = title
             return
+        if self._skip_depth > 0:
+            return
         text = data.strip()
         if text:
-            self._chunks.append(text + " ")
+            self._buf.write(text)
+            self._buf.write(" ")
+
+
+def parse_html(html: str):
+    # Parse with the lexbor C engine when selectolax is installed
+    if LexborHTMLParser is None:
+        return None
+    return LexborHTMLParser(html)
+
+
+def _replay(root, handler: HTMLParser) -> None:
+    # Walk a parsed tree in document order and emit the callbacks html.parser
+    # would, so the handlers above work unchanged on either parser.
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            handler.handle_endtag(node)
+            continue
+        tag = node.tag
+        if tag == "-text":
+            handler.handle_data(node.text_content or "")
+            continue
+        if tag.startswith("-"):
+            # comments, doctype
+            continue
+        handler.handle_starttag(tag, list(node.attributes.items()))
+        if tag not in VOID_TAGS:
+            stack.append(tag)
+        children = []
+        child = node.child
+        while child is not None:
+            children.append(child)
+            child = child.next
+        stack.extend(reversed(children))
+
+
+def extract_text(html: str, tree=None) -> Tuple[str, str]:
+    extractor = TextExtractor()
+    if tree is None:
+        extractor.feed(html)
+    else:
+        _replay(tree.root, extractor)
+    return extractor.title, extractor.get_text()
 
 
-def fetch_html(url: str, timeout_s: float, max_bytes: int) -> str:
-    req = Request(
-        url,
-        headers={
+def new_session() -> requests.Session:
+    # One session per run so --follow-next reuses the connection to the same host
+    session = requests.Session()
+    session.headers.update(
+        {
             "User-Agent": "Mozilla/5.0 (compatible; SimpleScraper/1.0)",
             "Accept-Language": "fa,en;q=0.8",
-        },
+            "Accept-Encoding": "gzip, deflate",
+        }
     )
-    with urlopen(req, timeout=timeout_s) as resp:
-        raw = resp.read(max_bytes)
-        charset = resp.headers.get_content_charset() or "utf-8"
+    return session
+
+
+def fetch_html(session: requests.Session, url: str, timeout_s: float, max_bytes: int) -> str:
+    with session.get(url, timeout=timeout_s, stream=True) as resp:
+        resp.raise_for_status()
+        raw = resp.raw.read(max_bytes, decode_content=True)
+        # Same charset rules as urllib: only an explicit charset parameter counts
+        headers = Message()
+        headers["Content-Type"] = resp.headers.get("Content-Type", "")
+        charset = headers.get_content_charset() or "utf-8"
     try:
         return raw.decode(charset, errors="strict")
-    except UnicodeDecodeError:
+    except (UnicodeDecodeError, LookupError):
         return raw.decode("utf-8", errors="replace")
 
 
 def split_paragraphs(text: str) -> List[str]:
-    parts = [p.strip() for p in re.split(r"\n{2,}", text) if p.strip()]
+    text = _INVALID_XML_RE.sub("", text)
+    parts = [p.strip() for p in _NL2_RE.split(text) if p.strip()]
     return parts
 
 
-def build_xml(url: str, title: str, text: str) -> ET.Element:
-    root = ET.Element("document")
-    ET.SubElement(root, "url").text = url
-    ET.SubElement(root, "title").text = title
-    text_el = ET.SubElement(root, "text")
-    for para in split_paragraphs(text):
+def build_page(page: dict, tag: str = "page") -> ET._Element:
+    page_el = ET.Element(tag)
+    ET.SubElement(page_el, "url").text = page["url"]
+    ET.SubElement(page_el, "title").text = _INVALID_XML_RE.sub("", page["title"])
+    text_el = ET.SubElement(page_el, "text")
+    for para in split_paragraphs(page["text"]):
         ET.SubElement(text_el, "p").text = para
-    return root
+    return page_el
 
 
-def build_xml_pages(pages: List[dict]) -> ET.Element:
-    root = ET.Element("document")
-    for page in pages:
-        page_el = ET.SubElement(root, "page")
-        ET.SubElement(page_el, "url").text = page["url"]
-        ET.SubElement(page_el, "title").text = page["title"]
-        text_el = ET.SubElement(page_el, "text")
-        for para in split_paragraphs(page["text"]):
-            ET.SubElement(text_el, "p").text = para
-    return root
-
-
-def write_xml(root: ET.Element, output_path: str) -> None:
-    tree = ET.ElementTree(root)
-    tree.write(output_path, encoding="utf-8", xml_declaration=True)
+def write_xml(pages: Iterable[dict], output_path: str, single: bool = False) -> None:
+    # A single page is written flat under <document>; otherwise one <page> per entry
+    with open(output_path, "wb", buffering=1 << 20) as f, ET.xmlfile(f, encoding="utf-8") as xf:
+        xf.write_declaration()
+        if single:
+            xf.write(build_page(next(iter(pages)), tag="document"))
+            return
+        with xf.element("document"):
+            for page in pages:
+                xf.write(build_page(page))
 
 
 def normalize_url(url: str) -> str:
@@ -148,7 +249,7 @@ def normalize_url(url: str) -> str:
 
 
 def cache_key(url: str) -> str:
-    return re.sub(r"[^A-Za-z0-9._-]+", "_", url)
+    return _CACHE_KEY_RE.sub("_", url)
 
 
 def read_cache(cache_dir: str, url: str) -> Optional[str]:
@@ -233,15 +334,27 @@ class NextLinkFinder(HTMLParser):
         if self.next_href is not None:
             return
         tag = tag.lower()
-        attrs_dict = {k.lower(): v for k, v in attrs if k}
+        if tag not in ("a", "img"):
+            return
+        # html.parser already lowercases attribute names; scan the pairs
+        # directly rather than building a dict for every tag.
         if tag == "a":
             self._in_anchor = True
-            self._current_href = attrs_dict.get("href")
-            if attrs_dict.get("rel") == "next" and self._current_href:
+            self._current_href = None
+            rel = None
+            for name, value in attrs:
+                if name == "href":
+                    self._current_href = value
+                elif name == "rel":
+                    rel = value
+            if rel == "next" and self._current_href:
                 self.next_href = self._current_href
-        elif tag == "img" and self._in_anchor and self._current_href:
-            alt = (attrs_dict.get("alt") or "").strip().lower()
-            if alt in {"next", "next part", "next page"}:
+        elif self._in_anchor and self._current_href:
+            alt = None
+            for name, value in attrs:
+                if name == "alt":
+                    alt = value
+            if (alt or "").strip().lower() in NEXT_ALTS:
                 self.next_href = self._current_href
 
     def handle_endtag(self, tag: str) -> None:
@@ -250,43 +363,70 @@ class NextLinkFinder(HTMLParser):
             self._current_href = None
 
 
-def find_next_url(html: str, base_url: str) -> Optional[str]:
-    finder = NextLinkFinder()
-    finder.feed(html)
-    if not finder.next_href:
+def _find_next_href(tree) -> Optional[str]:
+    for anchor in tree.css("a"):
+        href = anchor.attributes.get("href")
+        if not href:
+            continue
+        if anchor.attributes.get("rel") == "next":
+            return href
+        for img in anchor.css("img"):
+            if (img.attributes.get("alt") or "").strip().lower() in NEXT_ALTS:
+                return href
+    return None
+
+
+def find_next_url(html: str, base_url: str, tree=None) -> Optional[str]:
+    if tree is None:
+        finder = NextLinkFinder()
+        finder.feed(html)
+        next_href = finder.next_href
+    else:
+        next_href = _find_next_href(tree)
+    if not next_href:
         return None
-    return urljoin(base_url, finder.next_href)
+    return urljoin(base_url, next_href)
+
+
+def load_html(session: requests.Session, url: str, args: argparse.Namespace) -> str:
+    html = None
+    if not args.no_cache:
+        html = read_cache(args.cache_dir, url)
+    if html is None:
+        if args.delay > 0:
+            time.sleep(args.delay)
+        html = fetch_html(session, url, args.timeout, args.max_bytes)
+        if not args.no_cache:
+            write_cache(args.cache_dir, url, html)
+    return html
 
 
 def main(argv: List[str]) -> int:
     args = parse_args(argv)
     url = normalize_url(args.url)
+    max_pages = max(1, args.max_pages)
     pages: List[dict] = []
     seen_urls = set()
-    for _ in range(max(1, args.max_pages)):
-        if url in seen_urls:
-            break
-        seen_urls.add(url)
-        html = None
-        if not args.no_cache:
-            html = read_cache(args.cache_dir, url)
-        if html is None:
-            if args.delay > 0:
-                time.sleep(args.delay)
-            html = fetch_html(url, args.timeout, args.max_bytes)
-            if not args.no_cache:
-                write_cache(args.cache_dir, url, html)
-        extractor = TextExtractor()
-        extractor.feed(html)
-        pages.append({"url": url, "title": extractor.title, "text": extractor.get_text()})
-        if not args.follow_next:
-            break
-        next_url = find_next_url(html, url)
-        if not next_url:
-            break
-        url = normalize_url(next_url)
-    root = build_xml_pages(pages) if args.follow_next else build_xml(pages[0]["url"], pages[0]["title"], pages[0]["text"])
-    write_xml(root, args.output)
+    session = new_session()
+    with session, ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(load_html, session, url, args)
+        while future is not None:
+            html = future.result()
+            seen_urls.add(url)
+            tree = parse_html(html)
+            future = None
+            next_url = None
+            if args.follow_next and len(pages) + 1 < max_pages:
+                next_url = find_next_url(html, url, tree)
+                if next_url:
+                    next_url = normalize_url(next_url)
+                if next_url and next_url not in seen_urls:
+                    # Fetch the next page while this one is being extracted
+                    future = executor.submit(load_html, session, next_url, args)
+            title, text = extract_text(html, tree)
+            pages.append({"url": url, "title": title, "text": text})
+            url = next_url
+    write_xml(pages, args.output, single=not args.follow_next)
     return 0
 
 
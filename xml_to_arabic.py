@@ -2,8 +2,18 @@
 from __future__ import annotations
 
 import argparse
-import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import nullcontext, suppress
+import os
+import sys
 from typing import Dict
+from xml.sax.saxutils import escape
+
+try:
+    from lxml import etree as ET
+except ImportError as exc:
+    raise SystemExit("Missing dependency: lxml. Install with: pip install lxml") from exc
 
 
 def build_default_map() -> Dict[str, str]:
@@ -63,27 +73,154 @@ def build_default_map() -> Dict[str, str]:
     return mapping
 
 
-def transform_text(text: str, mapping: Dict[str, str]) -> str:
-    if not text:
-        return text
-    out = []
-    for ch in text:
-        out.append(mapping.get(ch, ch))
-    return "".join(out)
+def build_table(mapping: Dict[str, str]) -> Dict[int, str]:
+    # Per-character lookup only ever matched single-character keys; "ǰ".upper()
+    # is two code points and never matched, so leave it out of the table.
+    return str.maketrans({k: v for k, v in mapping.items() if len(k) == 1})
 
 
-def convert_xml(input_path: str, output_path: str) -> None:
-    mapping = build_default_map()
-    tree = ET.parse(input_path)
-    root = tree.getroot()
+_TABLE = build_table(build_default_map())
 
-    for elem in root.iter():
-        if elem.text:
-            elem.text = transform_text(elem.text, mapping)
-        if elem.tail:
-            elem.tail = transform_text(elem.tail, mapping)
 
-    tree.write(output_path, encoding="utf-8", xml_declaration=True)
+def transform_text(text: str, mapping: Dict = _TABLE) -> str:
+    # Accepts a str.maketrans table or a {str: str} map like build_default_map()
+    if not text:
+        return text
+    if mapping is not _TABLE and isinstance(next(iter(mapping), None), str):
+        mapping = build_table(mapping)
+    return text.translate(mapping)
+
+
+def _transform_subtree(elem, table: Dict[int, str] = _TABLE) -> None:
+    # The element's own tail is not parsed yet when iterparse reports it.
+    # Processing instruction content (e.g. xml-stylesheet) is not text; keep it.
+    for node in elem.iter():
+        if node.text and node.tag is not ET.PI:
+            node.text = transform_text(node.text, table)
+        if node.tail and node is not elem:
+            node.tail = transform_text(node.tail, table)
+
+
+def translate_batch_bytes(data: bytes) -> bytes:
+    # Worker entry point: data is a root shell holding a batch of top-level
+    # children (elements, comments, PIs), each with its tail
+    shell = ET.fromstring(data, ET.XMLParser(huge_tree=True))
+    for child in shell:
+        _transform_subtree(child)
+        child.tail = transform_text(child.tail)
+    return ET.tostring(shell, encoding="utf-8")
+
+
+# Parsed nodes sent to a worker per task. One task per top-level child costs
+# the main process more in pickling and Futures than translating it in-process.
+BATCH_NODES = 5000
+
+
+def _root_shell(root) -> tuple:
+    # An empty copy of the root. Top-level children are serialized inside it so
+    # they reuse its namespace declarations (including the implicit xml:
+    # prefix) instead of repeating them, then its start/end tags are sliced off.
+    shell = ET.Element(root.tag, attrib=dict(root.attrib), nsmap=root.nsmap)
+    shell.text = ""
+    data = ET.tostring(shell, encoding="utf-8")
+    split = data.rindex(b"</")
+    return shell, data[:split], data[split:]
+
+
+def _write_child(f, item, start_tag: bytes, end_tag: bytes) -> None:
+    data = item.result() if isinstance(item, Future) else item
+    f.write(data[len(start_tag) : len(data) - len(end_tag)])
+
+
+def convert_xml(input_path: str, output_path: str, workers: int = 1) -> None:
+    # Write next to the output and swap it in only on success: the input is
+    # still being read while we write (it may even be the same file).
+    tmp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb", buffering=1 << 20) as f:
+            _convert_stream(input_path, f, workers)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+
+
+def _convert_stream(input_path: str, f, workers: int) -> None:
+    # Stream the document: each top-level child of the root is translated and
+    # written once complete, then dropped, so memory stays bounded by one child
+    # (or a small window of batches in flight when running with workers).
+    # huge_tree lifts libxml2's limits on text node size and nesting depth,
+    # which large corpora exceed
+    context = ET.iterparse(input_path, events=("start", "end", "comment", "pi"), huge_tree=True)
+    for event, root in context:
+        if event == "start":
+            break
+    shell, start_tag, end_tag = _root_shell(root)
+
+    executor_cm = ProcessPoolExecutor(max_workers=workers) if workers > 1 else nullcontext()
+    max_in_flight = workers * 2 if workers > 1 else 0
+    batch_limit = BATCH_NODES if workers > 1 else 0
+    with executor_cm as executor:
+        f.write(b"<?xml version='1.0' encoding='utf-8'?>\n")
+        f.write(start_tag)
+        depth = 0
+        wrote_text = False
+        pending = None
+        batch_nodes = 0
+        # Serialized root shells (or Futures of them) in document order
+        queue: deque = deque()
+
+        def flush() -> None:
+            nonlocal batch_nodes
+            batch_nodes = 0
+            data = ET.tostring(shell, encoding="utf-8")
+            if executor is None:
+                queue.append(data)
+            else:
+                queue.append(executor.submit(translate_batch_bytes, data))
+            del shell[:]
+
+        for event, elem in context:
+            if depth == 0:
+                # A top-level boundary: root.text and the previous
+                # child's tail are both known by now.
+                if not wrote_text:
+                    if root.text:
+                        f.write(escape(transform_text(root.text)).encode("utf-8"))
+                    wrote_text = True
+                if pending is not None:
+                    if executor is None:
+                        pending.tail = transform_text(pending.tail)
+                    # Moves the child (and its tail) out of the parsed tree
+                    shell.append(pending)
+                    pending = None
+                    if batch_nodes >= batch_limit:
+                        flush()
+                while len(queue) > max_in_flight:
+                    _write_child(f, queue.popleft(), start_tag, end_tag)
+            if event != "end":
+                batch_nodes += 1
+            if event == "start":
+                depth += 1
+            elif event == "end":
+                if elem is root:
+                    break
+                depth -= 1
+                if depth == 0:
+                    if executor is None:
+                        _transform_subtree(elem)
+                    pending = elem
+            elif depth == 0:
+                # Top-level comment or PI
+                if executor is None:
+                    _transform_subtree(elem)
+                pending = elem
+        if len(shell):
+            flush()
+        while queue:
+            _write_child(f, queue.popleft(), start_tag, end_tag)
+        f.write(end_tag)
 
 
 def parse_args(argv: list[str]) -> argparse.Namespace:
@@ -97,14 +234,20 @@ def parse_args(argv: list[str]) -> argparse.Namespace:
         default="arabic.xml",
         help="Output XML file (default: arabic.xml)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Translate batches of top-level elements in this many processes (default: 1, in-process)",
+    )
     return parser.parse_args(argv)
 
 
 def main(argv: list[str]) -> int:
     args = parse_args(argv)
-    convert_xml(args.input, args.output)
+    convert_xml(args.input, args.output, max(1, args.workers))
     return 0
 
 
 if __name__ == "__main__":
-    raise SystemExit(main(__import__("sys").argv[1:]))
+    raise SystemExit(main(sys.argv[1:]))